@@ -1,5 +1,5 @@
 // Feather ESP32 V2 — BLE Client + Stepper Motor Control + Homing task + Serial bridge
-// - Subscribes to 100 Hz notifications (14 bytes): [u32 seq][u32 ms][u16 ch0][u16 ch2][u16 ch3]
+// - Subscribes to batched notifications: N x 14-byte samples [u32 seq][u32 ms][u16 ch0][u16 ch2][u16 ch3] (100 Hz)
 // - Forwards each sample to USB Serial as CSV: "seq,ms,ch0,ch2,ch3\n"
 // - Prints once-per-second RX% stats
 // - Serial motor cmds: S (speed), T (toggle dir), X (stop), L (home)
@@ -41,13 +41,12 @@ struct __attribute__((packed)) Packet {
 };
 static_assert(sizeof(Packet) == 14, "Packet must be 14 bytes");
 
-// Mailbox for latest sample (BLE callback -> main loop)
-volatile uint32_t g_latest_seq = 0;
-volatile uint32_t g_latest_ms  = 0;
-volatile uint16_t g_latest_ch0 = 0;
-volatile uint16_t g_latest_ch2 = 0;
-volatile uint16_t g_latest_ch3 = 0;
-volatile bool     g_latest_ready = false;
+// Sample ring (BLE callback -> main loop). Each notify carries several
+// samples, so a single-slot mailbox would keep only the last of them.
+#define RX_RING_LEN 64  // power of two
+static Packet            g_ring[RX_RING_LEN];
+static volatile uint32_t g_ring_head = 0;  // written by notifyCB only
+static volatile uint32_t g_ring_tail = 0;  // written by loop() only
 
 // RX stats (per-second window)
 volatile uint32_t g_rx_in_window   = 0;
@@ -60,26 +59,27 @@ static inline uint32_t seq_gap(uint32_t prev, uint32_t cur) {
 }
 
 void notifyCB(BLERemoteCharacteristic* chr, uint8_t* data, size_t len, bool) {
-  if (len < sizeof(Packet)) return;
-  Packet p;
-  memcpy(&p, data, sizeof(Packet));
-
-  // Stats
-  if (g_have_prev) {
-    g_miss_in_window += seq_gap(g_prev_seq, p.seq);
-  } else {
-    g_have_prev = true;
+  for (size_t off = 0; off + sizeof(Packet) <= len; off += sizeof(Packet)) {
+    Packet p;
+    memcpy(&p, data + off, sizeof(Packet));
+
+    // Stats
+    if (g_have_prev) {
+      g_miss_in_window += seq_gap(g_prev_seq, p.seq);
+    } else {
+      g_have_prev = true;
+    }
+    g_prev_seq = p.seq;
+    g_rx_in_window++;
+
+    // Publish to the ring; drop the sample if loop() has fallen a full ring behind
+    uint32_t head = g_ring_head;
+    if (head - g_ring_tail < RX_RING_LEN) {
+      g_ring[head & (RX_RING_LEN - 1)] = p;
+      __sync_synchronize();
+      g_ring_head = head + 1;
+    }
   }
-  g_prev_seq = p.seq;
-  g_rx_in_window++;
-
-  // Publish latest (mailbox)
-  g_latest_seq  = p.seq;
-  g_latest_ms   = p.ms;
-  g_latest_ch0  = p.ch0;
-  g_latest_ch2  = p.ch2;
-  g_latest_ch3  = p.ch3;
-  g_latest_ready = true;
 }
 
 class ClientCB : public BLEClientCallbacks {
@@ -218,16 +218,16 @@ void loop() {
   }
   if (!gConnected) BLEDevice::getScan()->start(5, false);
 
-  // --- Stream latest sample over Serial (CSV)
-  if (g_latest_ready) {
-    noInterrupts();
-    uint32_t seq = g_latest_seq, ms = g_latest_ms;
-    uint16_t ch0 = g_latest_ch0, ch2 = g_latest_ch2, ch3 = g_latest_ch3;
-    g_latest_ready = false;
-    interrupts();
+  // --- Stream every queued sample over Serial (CSV)
+  uint32_t head = g_ring_head;
+  __sync_synchronize();
+  while (g_ring_tail != head) {
+    Packet p = g_ring[g_ring_tail & (RX_RING_LEN - 1)];
+    __sync_synchronize();  // slot copied before it is handed back
+    g_ring_tail = g_ring_tail + 1;
 
     Serial.printf("%lu,%lu,%u,%u,%u\n",
-                  (unsigned long)seq, (unsigned long)ms, ch0, ch2, ch3);
+                  (unsigned long)p.seq, (unsigned long)p.ms, p.ch0, p.ch2, p.ch3);
   }
 
   // --- Serial motor commands (same as before)
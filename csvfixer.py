@@ -1,17 +1,22 @@
-import pandas as pd
+import csv
 import os
 
 csv_path = "experiment_log (Copy).csv"  # your active file
 
 # Safety check
 if os.path.exists(csv_path):
-    df = pd.read_csv(csv_path)
+    # Stream rows through to a temp file so memory stays flat for any log size
+    tmp_path = csv_path + ".tmp"
+    with open(csv_path, newline="") as src, open(tmp_path, "w", newline="") as dst:
+        reader = csv.DictReader(src)
+        writer = csv.DictWriter(dst, fieldnames=reader.fieldnames, extrasaction="ignore")
+        writer.writeheader()
 
-    # Keep only rows that have a valid frame_name
-    df = df[df["frame_name"].notna() & (df["frame_name"].astype(str).str.strip() != "")]
+        # Keep only rows that have a valid frame_name
+        writer.writerows(row for row in reader if (row.get("frame_name") or "").strip())
 
-    # Overwrite the file with the cleaned data
-    df.to_csv(csv_path, index=False)
+    # Atomically replace the file with the cleaned data
+    os.replace(tmp_path, csv_path)
     print("✅ Deleted all rows without frame_name.")
 else:
     print("⚠️ CSV file not found.")
@@ -0,0 +1,38 @@
+import csv
+import math
+import os
+import struct
+
+bin_path = "experiment_log.bin"  # binary log written with BINARY_LOG = True
+csv_path = os.path.splitext(bin_path)[0] + ".csv"
+
+# Must match _BIN_REC in gui/motor_controls_gui.py
+record = struct.Struct("<IqIIfffffff32sff??")
+header = [
+    "index", "timestamp_ns", "seq", "ms", "motor_angle_deg", "motor_speed",
+    "CH0_volts", "CH2_volts", "CH3_volts",
+    "ellipse_angle_deg", "ellipse_area_px2", "frame_name",
+    "ch2_dv/dt", "ch3_dv/dt", "ch2_flag", "ch3_flag",
+]
+
+if os.path.exists(bin_path):
+    with open(bin_path, "rb") as src, open(csv_path, "w", newline="") as dst:
+        writer = csv.writer(dst)
+        writer.writerow(header)
+        data = src.read()
+        # A run that died mid-write leaves a partial last record; keep the rest
+        partial = len(data) % record.size
+        if partial:
+            print(f"⚠️ Ignoring {partial} trailing bytes (truncated last record).")
+            data = data[:len(data) - partial]
+        for row in record.iter_unpack(data):
+            row = list(row)
+            row[6:9] = (f"{v:.6f}" for v in row[6:9])
+            row[9] = "" if math.isnan(row[9]) else round(row[9], 2)
+            row[10] = "" if math.isnan(row[10]) else round(row[10], 1)
+            row[11] = row[11].rstrip(b"\0").decode()
+            row[12:14] = (f"{v:.6f}" for v in row[12:14])
+            writer.writerow(row)
+    print(f"✅ Wrote {csv_path}.")
+else:
+    print("⚠️ Binary log not found.")
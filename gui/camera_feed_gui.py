@@ -8,29 +8,86 @@ Basler Camera Feed + Contour Tracking + Asynchronous Frame Saving
 """
 
 import tkinter as tk
-import threading, queue, time, os
+import threading, queue, time, os, io, tarfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageTk
 import cv2
 import numpy as np
 from pypylon import pylon
 
-from states import motor_state, file_state, ellipse_state, frame_state
+from states import motor_state, ellipse_state, frame_state, init_run_dir
 
 TARGET_UI_FPS = 30
+DISPLAY_W = 720          # on-screen width; height follows the frame aspect
+DETECT_SCALE = 0.5       # contour detection runs on a downscaled copy of the frame
 SAVE_EVERY_N_FRAMES = 5  # <----- SAVE 1 OUT OF EVERY 10 FRAMES
+POOL_SIZE = 4            # recycled Mono8 frame buffers (grabber, queue, UI, spare)
+MAX_NUM_BUFFER = 8       # pylon driver-side grab buffers
+ENCODE_WORKERS = 2       # JPEG encodes run in parallel (libjpeg releases the GIL)
+JPEG_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 95]  # same quality cv2.imwrite used
+SAVE_AS_TAR = False      # append frames to images/frames.tar instead of one file each
+SAVE_QUEUE_LEN = 20      # frames waiting for the saver; the oldest is dropped on overflow
+SAVE_LOG_EVERY = 100     # print a save progress line every N frames, not every frame
+
+# Overlay colours, in RGBA order since annotation happens on the RGBA display
+# copy (opaque alpha, or Tk would show the strokes as transparent)
+GREEN_RGBA = (0, 255, 0, 255)
+RED_RGBA = (255, 0, 0, 255)
+
+# Run blur/threshold through OpenCV's T-API when an OpenCL device exists;
+# otherwise stay on the plain CPU path with reused scratch buffers
+USE_OPENCL = cv2.ocl.haveOpenCL()
+cv2.ocl.setUseOpenCL(USE_OPENCL)
+
+
+def _encode_jpeg(frame):
+    # Colour frames arrive as RGB; libjpeg wants BGR. Swapping here keeps the
+    # cost on the encode pool instead of the per-frame display path.
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+    ok, buf = cv2.imencode(".jpg", frame, JPEG_PARAMS)
+    return buf if ok else None
+
+
+# ==============================================================
+# Frame Handoff
+# ==============================================================
+class LatestFrame:
+    """Single-slot, latest-wins handoff from the grabber to the UI."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frame = None
+        self.ready = threading.Event()
+
+    def put(self, frame):
+        """Publish a frame; returns the unconsumed frame it replaced, if any."""
+        with self._lock:
+            old, self._frame = self._frame, frame
+            self.ready.set()
+        return old
+
+    def take(self):
+        """Take the newest frame (or None) and empty the slot."""
+        with self._lock:
+            frame, self._frame = self._frame, None
+            self.ready.clear()
+        return frame
 
 
 # ==============================================================
 # Camera Thread
 # ==============================================================
 class CameraGrabber(threading.Thread):
-    def __init__(self, frame_queue: queue.Queue, stop_event: threading.Event):
+    def __init__(self, frame_slot: LatestFrame, stop_event: threading.Event):
         super().__init__(daemon=True)
-        self.q = frame_queue
+        self.slot = frame_slot
         self.stop_event = stop_event
         self.cam = None
         self.converter = None
         self.err = None
+        self.free = None  # recycled frame buffers (Mono8 passthrough only)
 
     def run(self):
         try:
@@ -47,27 +104,36 @@ class CameraGrabber(threading.Thread):
             self.cam.GainAuto.SetValue("Off")
             self.cam.Gain.SetValue(28.0)
 
+            # Prefer Mono8 so grabs can skip the converter; fall back to
+            # whatever the sensor lists first
             syms = self.cam.PixelFormat.GetSymbolics()
-            self.cam.PixelFormat.SetValue(syms[0])
+            self.cam.PixelFormat.SetValue("Mono8" if "Mono8" in syms else syms[0])
             print("[camera_feed_gui] Using PixelFormat:", self.cam.PixelFormat.GetValue())
 
             self.converter = pylon.ImageFormatConverter()
             if "Mono" in self.cam.PixelFormat.GetValue():
                 self.converter.OutputPixelFormat = pylon.PixelType_Mono8
             else:
-                self.converter.OutputPixelFormat = pylon.PixelType_BGR8packed
+                self.converter.OutputPixelFormat = pylon.PixelType_RGB8packed
             self.converter.OutputBitAlignment = pylon.OutputBitAlignment_MsbAligned
 
+            # Mono8 needs no conversion, so copy grabs into a fixed pool of
+            # buffers instead of allocating a fresh array per frame
+            if self.cam.PixelFormat.GetValue() == "Mono8":
+                h, w = self.cam.Height.Value, self.cam.Width.Value
+                self.free = queue.SimpleQueue()
+                for _ in range(POOL_SIZE):
+                    self.free.put(np.empty((h, w), np.uint8))
+
+            self.cam.MaxNumBuffer.SetValue(MAX_NUM_BUFFER)
             self.cam.StartGrabbing(pylon.GrabStrategy_LatestImageOnly)
 
             while not self.stop_event.is_set() and self.cam.IsGrabbing():
                 grab = self.cam.RetrieveResult(5000, pylon.TimeoutHandling_ThrowException)
                 if grab.GrabSucceeded():
-                    img = self.converter.Convert(grab).GetArray()
-                    try:
-                        self.q.put_nowait(img)
-                    except queue.Full:
-                        pass
+                    img = self._frame_from(grab)
+                    if img is not None:
+                        self._publish(img)
                 grab.Release()
 
         except Exception as e:
@@ -83,6 +149,26 @@ class CameraGrabber(threading.Thread):
             except Exception:
                 pass
 
+    def _frame_from(self, grab):
+        if self.free is None:
+            return self.converter.Convert(grab).GetArray()
+        try:
+            img = self.free.get_nowait()
+        except queue.Empty:
+            return None  # consumer still holds every buffer; skip this frame
+        with grab.GetArrayZeroCopy() as arr:
+            np.copyto(img, arr)
+        return img
+
+    def _publish(self, img):
+        # Latest wins: an unconsumed older frame goes back to the pool
+        self.recycle(self.slot.put(img))
+
+    def recycle(self, img):
+        """Return a frame buffer to the pool once the consumer is done with it."""
+        if self.free is not None and img is not None:
+            self.free.put(img)
+
 
 # ==============================================================
 # Camera Window + UI
@@ -97,116 +183,248 @@ def _build_camera_window(parent):
     info = tk.Label(top, text="Initializing camera…")
     info.pack(anchor="w")
 
-    frame_queue = queue.Queue(maxsize=2)
-    save_queue = queue.Queue(maxsize=20)  # bigger buffer
+    frame_slot = LatestFrame()
+    save_queue = deque(maxlen=SAVE_QUEUE_LEN)  # drop-oldest when the disk falls behind
+    save_cv = threading.Condition()
     stop_event = threading.Event()
 
-    grabber = CameraGrabber(frame_queue, stop_event)
+    grabber = CameraGrabber(frame_slot, stop_event)
     grabber.start()
 
+    # Annotated RGBA frames from the CV worker to the UI, plus their free list.
+    # RGBA rather than RGB so PIL can map the buffer instead of copying it.
+    display_slot = LatestFrame()
+    display_free = queue.SimpleQueue()
+
     tk_image = None
-    frame_index = 0
-    dropped = 0  # track dropped frames
+    info_text = [None]  # last status shown, so the label is only touched on change
+
+    # Scratch images and per-format steps for the contour pipeline, rebuilt
+    # only when the frame shape changes (in practice once, on the first frame)
+    cv_bufs = {"shape": None, "gray": None, "det": None, "bin": None,
+               "scale": 1.0, "to_gray": None, "to_small": None, "to_rgba": None}
+
+    def _specialise(shape):
+        hw = shape[:2]
+        mono = len(shape) == 2
+        det_hw = (round(hw[0] * DETECT_SCALE), round(hw[1] * DETECT_SCALE))
+        gray_buf = None if mono else np.empty(hw, np.uint8)
+        det = np.empty(det_hw, np.uint8)
+        scale = min(1.0, DISPLAY_W / hw[1])
+        disp_wh = (round(hw[1] * scale), round(hw[0] * scale))
+
+        if mono:
+            to_gray = lambda f: f
+            to_rgba = lambda src, dst: cv2.cvtColor(src, cv2.COLOR_GRAY2RGBA, dst=dst)
+        else:
+            to_gray = lambda f: cv2.cvtColor(f, cv2.COLOR_RGB2GRAY, dst=gray_buf)
+            to_rgba = lambda src, dst: cv2.cvtColor(src, cv2.COLOR_RGB2RGBA, dst=dst)
+
+        # Downscale for display; a mono frame at detection size reuses det
+        if scale == 1.0:
+            to_small = lambda f: f
+        elif mono and disp_wh == det_hw[::-1]:
+            to_small = lambda f: det
+        else:
+            to_small = lambda f: cv2.resize(f, disp_wh, interpolation=cv2.INTER_AREA)
+
+        cv_bufs.update(shape=shape, gray=gray_buf, det=det, bin=np.empty(det_hw, np.uint8),
+                       scale=scale, to_gray=to_gray, to_small=to_small, to_rgba=to_rgba)
 
     # ----------------------------------------------------------
     # FRAME SAVER THREAD
     # ----------------------------------------------------------
     def frame_saver():
-        base_dir = file_state["CURRENT_DIR"]
-        images_dir = os.path.join(base_dir, "images")
-        os.makedirs(images_dir, exist_ok=True)
+        images_dir = os.path.join(init_run_dir(), "images")
 
-        while not stop_event.is_set():
-            try:
-                ts, idx, frame_to_save = save_queue.get(timeout=0.5)
-            except queue.Empty:
-                continue
+        # Encoding is CPU-bound and runs on a small pool; this thread only
+        # hands frames out and writes finished buffers in submission order.
+        encoder = ThreadPoolExecutor(max_workers=ENCODE_WORKERS)
+        pending = deque()
 
-            filename = f"{ts}_frame_{idx:06d}.jpg"
-            path_full = os.path.join(images_dir, filename)
-            cv2.imwrite(path_full, frame_to_save)
-            print(f"[camera_feed_gui] Saved {filename}")
+        # Optional single append-only archive: one sequential stream, no
+        # per-frame inode. Member names match the logged frame_name.
+        tar = tarfile.open(os.path.join(images_dir, "frames.tar"), "a") if SAVE_AS_TAR else None
+        # Otherwise write loose files relative to a held directory handle
+        dir_fd = None if SAVE_AS_TAR else os.open(images_dir, os.O_RDONLY | os.O_DIRECTORY)
+        saved = 0
 
-            save_queue.task_done()
+        while not stop_event.is_set():
+            with save_cv:
+                if not save_queue:
+                    save_cv.wait(timeout=0.5)
+                item = save_queue.popleft() if save_queue else None
+
+            if item is None:
+                new_name = None
+            else:
+                ts, idx, frame_to_save = item
+                new_name = f"{ts}_frame_{idx:06d}.jpg"
+                pending.append((new_name, encoder.submit(_encode_jpeg, frame_to_save)))
+
+            # Write out finished encodes; block on the oldest when idle or
+            # when more frames are in flight than workers can keep busy.
+            while pending and (new_name is None or pending[0][1].done()
+                               or len(pending) > 2 * ENCODE_WORKERS):
+                filename, fut = pending.popleft()
+                buf = fut.result()
+                if buf is None:
+                    print(f"[camera_feed_gui] JPEG encode failed for {filename}")
+                    continue
+                if tar is not None:
+                    member = tarfile.TarInfo(filename)
+                    member.size = len(buf)
+                    member.mtime = time.time()
+                    tar.addfile(member, io.BytesIO(buf))
+                else:
+                    # One open/write/close; no Python file object or buffering layer
+                    fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644,
+                                 dir_fd=dir_fd)
+                    try:
+                        os.write(fd, buf)
+                    finally:
+                        os.close(fd)
+                saved += 1
+                if saved % SAVE_LOG_EVERY == 0:
+                    print(f"[camera_feed_gui] Saved {saved} frames (last {filename})")
+
+        encoder.shutdown(wait=False)
+        if tar is not None:
+            tar.close()  # writes the end-of-archive trailer
+        if dir_fd is not None:
+            os.close(dir_fd)
 
     threading.Thread(target=frame_saver, daemon=True).start()
 
     # ----------------------------------------------------------
-    # UI UPDATE LOOP
+    # CV WORKER THREAD
     # ----------------------------------------------------------
-    def update_ui():
-        nonlocal tk_image, frame_index, dropped
+    def cv_worker():
+        # Wall-clock epoch captured once; per-frame stamps advance on the
+        # monotonic clock so they never step backwards mid-run
+        wall0_ns, mono0_ns = time.time_ns(), time.monotonic_ns()
+        frame_index = 0
+        dropped = 0  # track dropped frames
 
-        # Get latest frame only
-        frame = None
-        try:
-            while True:
-                frame = frame_queue.get_nowait()
-        except queue.Empty:
-            pass
+        while not stop_event.is_set():
+            if not frame_slot.ready.wait(timeout=0.5):
+                continue
+            frame = frame_slot.take()
+            if frame is None:
+                continue
+
+            if cv_bufs["shape"] != frame.shape:
+                _specialise(frame.shape)
+            det = cv_bufs["det"]
 
-        if frame is not None:
-            display = frame.copy()
+            # Detect on a downscaled grayscale copy; blur/threshold/contours
+            # are memory-bound so cost tracks pixel count
+            cv2.resize(cv_bufs["to_gray"](frame), det.shape[::-1], dst=det, interpolation=cv2.INTER_AREA)
+            small = cv_bufs["to_small"](frame)
+            scale = cv_bufs["scale"]
 
-            gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            blur = cv2.GaussianBlur(gray, (5, 5), 0)
-            _, thresh = cv2.threshold(blur, 50, 255, cv2.THRESH_BINARY)
+            # Display buffers cycle between this thread and the UI
+            try:
+                display = display_free.get_nowait()
+            except queue.Empty:
+                display = None
+            if display is None or display.shape[:2] != small.shape[:2]:
+                display = np.empty(small.shape[:2] + (4,), np.uint8)
+            cv_bufs["to_rgba"](small, display)
+
+            if USE_OPENCL:
+                blur = cv2.GaussianBlur(cv2.UMat(det), (5, 5), 0)
+                _, thresh = cv2.threshold(blur, 50, 255, cv2.THRESH_BINARY)
+                thresh = thresh.get()  # findContours is CPU-only
+            else:
+                blur = cv2.GaussianBlur(det, (5, 5), 0, dst=cv_bufs["bin"])
+                _, thresh = cv2.threshold(blur, 50, 255, cv2.THRESH_BINARY, dst=blur)  # in place
             contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
             if contours:
                 largest = max(contours, key=cv2.contourArea)
-                area = cv2.contourArea(largest)
+                # Report area in full-resolution pixels
+                area = cv2.contourArea(largest) / (DETECT_SCALE * DETECT_SCALE)
 
                 M = cv2.moments(largest)
                 if M["m00"] != 0:
-                    cx = int(M["m10"] / M["m00"])
-                    cy = int(M["m01"] / M["m00"])
+                    cx = M["m10"] / M["m00"]
+                    cy = M["m01"] / M["m00"]
                 else:
                     cx, cy = 0, 0
 
+                # Angle is unchanged by uniform scaling
                 rect = cv2.minAreaRect(largest)
                 (x, y), (w, h), angle = rect
 
-                cv2.drawContours(display, [largest], -1, (0, 255, 0), 2)
-                cv2.circle(display, (cx, cy), 4, (0, 0, 255), -1)
+                to_disp = scale / DETECT_SCALE
+                outline = largest if to_disp == 1.0 else (largest * to_disp).astype(np.int32)
+                cv2.drawContours(display, [outline], -1, GREEN_RGBA, 2)
+                cv2.circle(display, (int(cx * to_disp), int(cy * to_disp)), 4, RED_RGBA, -1)
 
                 ellipse_state["angle_deg"] = angle
                 ellipse_state["area_px2"] = area
 
                 cv2.putText(display, f"Angle: {angle:.1f}",
                             (display.shape[1] - 200, 30),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, GREEN_RGBA, 2)
                 cv2.putText(display, f"Area: {area:.0f} px^2",
                             (display.shape[1] - 200, 60),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, GREEN_RGBA, 2)
 
-            # Display image in Tkinter
-            rgb = display if display.ndim == 3 else cv2.cvtColor(display, cv2.COLOR_GRAY2RGB)
-            pil = Image.fromarray(cv2.cvtColor(rgb, cv2.COLOR_BGR2RGB))
-            tk_image = ImageTk.PhotoImage(pil)
-            label.configure(image=tk_image)
+            # Latest wins: a display the UI never picked up goes back to the pool
+            stale = display_slot.put(display)
+            if stale is not None:
+                display_free.put(stale)
 
             # -------- ASYNC SAVE EVERY NTH FRAME --------
             if motor_state.get("running", False):
                 if frame_index % SAVE_EVERY_N_FRAMES == 0:
 
-                    ts = int(time.time() * 1000)
+                    ts = (time.monotonic_ns() - mono0_ns + wall0_ns) // 1_000_000
                     frame_state["name"] = f"{ts}_frame_{frame_index:06d}.jpg"
 
-                    try:
-                        save_queue.put_nowait((ts, frame_index, frame.copy()))
-                    except queue.Full:
-                        dropped += 1
-                        if dropped % 100 == 0:
-                            print(f"[warning] dropped {dropped} frames")
+                    item = (ts, frame_index, frame.copy())
+                    with save_cv:
+                        if len(save_queue) == SAVE_QUEUE_LEN:
+                            dropped += 1  # append below evicts the oldest
+                            if dropped % 100 == 0:
+                                print(f"[warning] dropped {dropped} frames")
+                        save_queue.append(item)
+                        save_cv.notify()
 
                 frame_index += 1
 
-        # Update text
-        if grabber.err:
-            info.config(text=f"[!] {grabber.err}")
-        else:
-            info.config(text="Streaming…")
+            grabber.recycle(frame)
+
+    threading.Thread(target=cv_worker, daemon=True).start()
+
+    # ----------------------------------------------------------
+    # UI UPDATE LOOP
+    # ----------------------------------------------------------
+    def update_ui():
+        nonlocal tk_image
+
+        # Annotated frames arrive ready to show; just blit the newest
+        display = display_slot.take()
+
+        if display is not None:
+            # PIL maps an RGBA buffer in place (RGB would be copied), so the
+            # only copy is the paste into the one PhotoImage; rebuild on resize
+            h, w = display.shape[:2]
+            pil = Image.frombuffer("RGBA", (w, h), display, "raw", "RGBA", 0, 1)
+            if tk_image is None or (tk_image.width(), tk_image.height()) != pil.size:
+                tk_image = ImageTk.PhotoImage(pil)
+                label.configure(image=tk_image)
+            else:
+                tk_image.paste(pil)
+            display_free.put(display)
+
+        # Update text only when it changes
+        status = f"[!] {grabber.err}" if grabber.err else "Streaming…"
+        if status != info_text[0]:
+            info_text[0] = status
+            info.config(text=status)
 
         top.after(int(1000 / TARGET_UI_FPS), update_ui)
 
@@ -1,45 +1,65 @@
 """
 Live feed plotting window (attaches to existing Tk root)
 
-- Imports data queues from motor_controls_gui (single serial owner).
-- Uses deques for rolling Y-buffers and a monotonically increasing X index
-  so the plot side-scrolls smoothly past the visible window.
+- Reads the CH2/CH3 ring buffer from motor_controls_gui (single serial owner).
+- Keeps the visible window in fixed NumPy arrays (oldest first) and a
+  monotonically increasing X index. The x-axis pages forward X_STEP samples
+  at a time, and the view is X_STEP wider than the buffer so all of it
+  stays on screen between pages.
 - attach_live_feed(parent=...) creates a Toplevel inside your main app.
 - If run directly (python live_feed_gui.py), it creates its own root and runs standalone.
 """
 
 import tkinter as tk
-from collections import deque
-from queue import Empty
 import traceback
 
+import numpy as np
+
 import matplotlib
 matplotlib.use("TkAgg")
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.ticker import MaxNLocator
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
 # Make sure this import path matches your project structure exactly.
 # Both main.py and this file must import the SAME module object.
-from gui.motor_controls_gui import data_queue_a0, data_queue_a1
+from gui.motor_controls_gui import ring_since, ring_state
 
 # ----------------------- Config -----------------------
 BUFFER_SIZE = 500           # how many points visible
-DRAIN_CAP_PER_FRAME = 200   # max pairs drained per UI tick
-UI_REFRESH_MS = 16          # ~60 fps
+UI_REFRESH_MS = max(16, 1000 // 30)  # ~30 fps
+X_STEP = BUFFER_SIZE // 5   # x-axis pages forward in steps so limits rarely change
+Y_SCALE_EVERY = 10          # re-check y-limits every Nth plot update (~3 Hz)
 
 # -------------------- Plotting State ------------------
-data_buffer_a0 = deque(maxlen=BUFFER_SIZE)  # CH2 volts
-data_buffer_a1 = deque(maxlen=BUFFER_SIZE)  # CH3 volts
+# Newest sample sits at the end; only the last 'filled' entries are valid
+data_buffer_a0 = np.zeros(BUFFER_SIZE, dtype=np.float32)  # CH2 volts
+data_buffer_a1 = np.zeros(BUFFER_SIZE, dtype=np.float32)  # CH3 volts
+x_offsets = np.arange(BUFFER_SIZE, dtype=np.float64)
+x_buffer = np.empty(BUFFER_SIZE, dtype=np.float64)
+filled = 0
 sample_idx = 0  # monotonically increasing x counter
 
+
+def _push(buf, new):
+    """Shift 'new' onto the end of a fixed window, dropping the oldest."""
+    k = len(new)
+    if k >= BUFFER_SIZE:
+        buf[:] = new[-BUFFER_SIZE:]
+    else:
+        buf[:-k] = buf[k:]  # NumPy handles the overlapping move
+        buf[-k:] = new
+
 # -------------------- Window Builder ------------------
 def _build_live_feed_window(parent):
     """Create the live feed plotting window as a Toplevel attached to 'parent'."""
     top = tk.Toplevel(parent)
     top.title("Live Feed")
 
-    # Matplotlib figure & axes
-    fig, ax = plt.subplots(1, 2, figsize=(10, 5))
+    # Matplotlib figure & axes; a bare Figure (not pyplot) so nothing global
+    # keeps it alive after this window closes
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots(1, 2)
     fig.suptitle("Live Data Stream", fontsize=16)
 
     # Left subplot (CH2)
@@ -47,14 +67,16 @@ def _build_live_feed_window(parent):
     ax[0].set_xlabel("Sample Index")
     ax[0].set_ylabel("Voltage (V)")
     ax[0].grid(True)
-    line_a0, = ax[0].plot([], [], 'r-')
+    ax[0].xaxis.set_major_locator(MaxNLocator(5, integer=True))
+    line_a0, = ax[0].plot([], [], 'r-', animated=True)
 
     # Right subplot (CH3)
     ax[1].set_title("CH3")
     ax[1].set_xlabel("Sample Index")
     ax[1].set_ylabel("Voltage (V)")
     ax[1].grid(True)
-    line_a1, = ax[1].plot([], [], '#87CEEB')
+    ax[1].xaxis.set_major_locator(MaxNLocator(5, integer=True))
+    line_a1, = ax[1].plot([], [], '#87CEEB', animated=True)
 
     fig.tight_layout(rect=[0, 0, 1, 0.95])
 
@@ -62,68 +84,94 @@ def _build_live_feed_window(parent):
     canvas_widget = canvas.get_tk_widget()
     canvas_widget.pack(fill=tk.BOTH, expand=True)
 
-    # Heartbeat: show queue sizes in the window title (quick sanity check)
-    def heartbeat():
-        try:
-            top.title(f"Live Feed  |  CH2_q={data_queue_a0.qsize()}  CH3_q={data_queue_a1.qsize()}")
-        finally:
-            top.after(250, heartbeat)
+    # Blitting: the static axes are cached after every full draw, and a
+    # normal tick only repaints the two lines over that background.
+    view = {'bg': None, 'x_right': None, 'job': None, 'tick': 0, 'title': None}
+
+    def on_draw(event):
+        view['bg'] = [canvas.copy_from_bbox(a.bbox) for a in ax]
+        ax[0].draw_artist(line_a0)
+        ax[1].draw_artist(line_a1)
+
+    canvas.mpl_connect('draw_event', on_draw)
 
     def update_plot():
-        global sample_idx
+        global sample_idx, filled
         try:
-            # Drain paired samples (keep queues in lockstep)
-            n_pairs = min(data_queue_a0.qsize(), data_queue_a1.qsize())
-            n_pairs = min(n_pairs, DRAIN_CAP_PER_FRAME)
-
-            if n_pairs > 0:
-                for _ in range(n_pairs):
-                    try:
-                        a0 = data_queue_a0.get_nowait()
-                        a1 = data_queue_a1.get_nowait()
-                    except Empty:
-                        break
-                    data_buffer_a0.append(a0)
-                    data_buffer_a1.append(a1)
-                    sample_idx += 1
+            # Heartbeat: show plot lag in the window title (quick sanity check)
+            title = f"Live Feed  |  samples={ring_state['head']}  lag={ring_state['head'] - sample_idx}"
+            if title != view['title']:
+                view['title'] = title
+                top.title(title)
+
+            # Copy every new pair out of the ring in one slice
+            head, new_a0, new_a1 = ring_since(sample_idx)
+
+            if len(new_a0):
+                _push(data_buffer_a0, new_a0)
+                _push(data_buffer_a1, new_a1)
+                filled = min(BUFFER_SIZE, filled + len(new_a0))
+                sample_idx = head
 
                 # Build x for the current visible window
-                n = len(data_buffer_a0)  # == len(data_buffer_a1)
+                n = filled
                 x_start = max(0, sample_idx - n)
-                x_vals = list(range(x_start, x_start + n))
+                x_vals = np.add(x_offsets[:n], x_start, out=x_buffer[:n])
+                y_a0 = data_buffer_a0[BUFFER_SIZE - n:]
+                y_a1 = data_buffer_a1[BUFFER_SIZE - n:]
 
                 # Update line data
-                line_a0.set_xdata(x_vals)
-                line_a0.set_ydata(list(data_buffer_a0))
-                line_a1.set_xdata(x_vals)
-                line_a1.set_ydata(list(data_buffer_a1))
-
-                # Scroll x-axis with data
-                x_left  = max(0, sample_idx - BUFFER_SIZE)
-                x_right = max(BUFFER_SIZE, sample_idx)
-                ax[0].set_xlim(x_left, x_right)
-                ax[1].set_xlim(x_left, x_right)
-
-                # Autoscale Y with padding
-                if n > 0:
-                    ymin0, ymax0 = min(data_buffer_a0), max(data_buffer_a0)
-                    ymin1, ymax1 = min(data_buffer_a1), max(data_buffer_a1)
-                    pad0 = max(0.05, 0.05 * (ymax0 - ymin0 + 1))
-                    pad1 = max(0.05, 0.05 * (ymax1 - ymin1 + 1))
-                    ax[0].set_ylim(ymin0 - pad0, ymax0 + pad0)
-                    ax[1].set_ylim(ymin1 - pad1, ymax1 + pad1)
-
-                canvas.draw_idle()
+                line_a0.set_data(x_vals, y_a0)
+                line_a1.set_data(x_vals, y_a1)
+
+                # Scroll x-axis with data, a page step at a time. The newest
+                # sample is within X_STEP of the right edge, so a view of
+                # BUFFER_SIZE + X_STEP always holds the whole buffer.
+                limits_changed = False
+                x_span = BUFFER_SIZE + X_STEP
+                x_right = max(x_span, -(-sample_idx // X_STEP) * X_STEP)
+                if x_right != view['x_right']:
+                    view['x_right'] = x_right
+                    ax[0].set_xlim(x_right - x_span, x_right)
+                    ax[1].set_xlim(x_right - x_span, x_right)
+                    limits_changed = True
+
+                # Autoscale Y with padding; only when data leaves the current
+                # limits or the limits are far looser than needed. The
+                # min/max scan runs every few updates, not on every tick.
+                view['tick'] = (view['tick'] + 1) % Y_SCALE_EVERY
+                if view['tick'] == 0 or view['bg'] is None:
+                    for a, y in ((ax[0], y_a0), (ax[1], y_a1)):
+                        ymin, ymax = float(y.min()), float(y.max())
+                        pad = max(0.05, 0.05 * (ymax - ymin + 1))
+                        lo, hi = a.get_ylim()
+                        if ymin < lo or ymax > hi or (hi - lo) > 2 * (ymax - ymin + 2 * pad):
+                            a.set_ylim(ymin - pad, ymax + pad)
+                            limits_changed = True
+
+                if limits_changed or view['bg'] is None:
+                    canvas.draw()  # on_draw recaptures the backgrounds
+                else:
+                    for a, line, bg in zip(ax, (line_a0, line_a1), view['bg']):
+                        canvas.restore_region(bg)
+                        a.draw_artist(line)
+                        canvas.blit(a.bbox)
 
         except Exception:
             print("[live_feed_gui] update_plot error:")
             traceback.print_exc()
 
         finally:
-            top.after(UI_REFRESH_MS, update_plot)
+            view['job'] = top.after(UI_REFRESH_MS, update_plot)
+
+    def on_close():
+        if view['job'] is not None:
+            top.after_cancel(view['job'])
+        view['bg'] = None
+        top.destroy()
 
-    top.after(250, heartbeat)
-    top.after(UI_REFRESH_MS, update_plot)
+    top.protocol("WM_DELETE_WINDOW", on_close)
+    view['job'] = top.after(UI_REFRESH_MS, update_plot)
     return top
 
 # -------------------- Public API ----------------------
@@ -4,28 +4,35 @@ Motor GUI + Serial owner + Data queues for plotting + Timer Logic
 - Talks to ONE device (Feather V2 that runs both: motor control + BLE client).
 - Owns the ONLY serial connection.
 - Parses CSV data lines from device.
-- Publishes thread-safe queues.
+- Publishes a lock-free ring buffer of CH2/CH3 volts for plotting.
 - Logs to experiment_log.csv.
 - NEW: Motor Timer (Hours) with Countdown.
 """
 
 import tkinter as tk
-import serial, time, threading, re, csv, atexit, os
-from datetime import datetime, timedelta
-from queue import Queue
+import serial, time, threading, atexit, os, struct, select
+from datetime import timedelta
+from queue import Queue, Full, Empty
+import numpy as np
 
 # --- External modules (your project) ---
 # Assuming these files exist in your directory
 from helpers import update_tkinter_input_box
-from states import motor_state, file_state, ellipse_state, frame_state
+from states import motor_state, ellipse_state, frame_state, init_run_dir
 
 # ===== Config =====
 SERIAL_PORT = '/dev/ttyACM0'
 BAUD = 115200
 
-# ===== Public data queues =====
-data_queue_a0: Queue[float] = Queue(maxsize=2000)  # CH2 volts
-data_queue_a1: Queue[float] = Queue(maxsize=2000)  # CH3 volts
+# ===== Public plot ring =====
+# Single producer (serial listener) / single consumer (plot window).
+# The listener writes a slot, then bumps ring_state['head']; readers slice
+# everything past their last seen head without taking a lock.
+RING_SIZE = 4096                  # must be a power of two
+RING_MASK = RING_SIZE - 1
+ring_a0 = np.zeros(RING_SIZE, dtype=np.float32)  # CH2 volts
+ring_a1 = np.zeros(RING_SIZE, dtype=np.float32)  # CH3 volts
+ring_state = {'head': 0}
 
 # Optional: latest snapshot others can read without touching queues
 latest = {"seq": 0, "ms": 0, "ch0": 0.0, "ch2": 0.0, "ch3": 0.0}
@@ -36,24 +43,24 @@ timer_state = {
     'end_time': 0.0
 }
 
-def _q_put_drop_oldest(q: Queue, item):
-    """Non-blocking put; if full, drop one oldest item then insert."""
-    try:
-        q.put_nowait(item)
-    except:
-        try:
-            q.get_nowait()
-        except:
-            pass
-        try:
-            q.put_nowait(item)
-        except:
-            pass
-
-# Regex for BLE summary lines
-BLE_LINE_RE = re.compile(
-    r"\[BLE RX\]\s+([\d\.]+)%\s+\(rx=(\d+),\s+miss=(\d+),\s+exp=(\d+)\)"
-)
+def ring_since(last):
+    """
+    Return (head, ch2, ch3) with every sample written after index 'last'.
+    If the reader fell more than RING_SIZE behind, the oldest are skipped.
+    """
+    head = ring_state['head']
+    start = max(last, head - RING_SIZE)
+    if start >= head:
+        return head, ring_a0[:0], ring_a1[:0]
+    i, j = start & RING_MASK, head & RING_MASK
+    if i < j:
+        return head, ring_a0[i:j].copy(), ring_a1[i:j].copy()
+    return (head,
+            np.concatenate((ring_a0[i:], ring_a0[:j])),
+            np.concatenate((ring_a1[i:], ring_a1[:j])))
+
+# Sample lines from the client: seq,ms,ch0,ch2,ch3
+CSV_FIELDS = 5
 
 # Track degrees
 degrees = 0.0
@@ -70,55 +77,148 @@ derivatives = {
     'ch2_flag': False,
     'ch3_flag': False,
 }
+SAMPLE_DT = 0.01  # 100 Hz → dt = 0.01 s
+_INV_DT = 1.0 / SAMPLE_DT
 
 # --- ADC Conversion ---
-def convert_to_voltage(raw, inputRange=4, vREF=4.096):
-    ratio = raw / (1 << 14)
-    if inputRange == 1:
-        return ratio * 3 * vREF / 2 - 1.5 * vREF / 2
-    elif inputRange == 2:
-        return ratio * 3 * vREF / 2 - 3 * vREF / 2
-    elif inputRange == 3:
-        return ratio * 3 * vREF / 2
-    elif inputRange == 4:
-        return ratio * 3 * vREF - 1.5 * vREF
-    elif inputRange == 5:
-        return ratio * 3 * vREF - 3 * vREF
-    elif inputRange == 6:
-        return ratio * 3 * vREF
-    elif inputRange == 7:
-        return ratio * 6 * vREF - 3 * vREF
-    return 0
+# volts = raw * scale + offset for each 14-bit input range
+def _range_table(vREF):
+    return {
+        1: (1.5 * vREF / 16384, -0.75 * vREF),
+        2: (1.5 * vREF / 16384, -1.5 * vREF),
+        3: (1.5 * vREF / 16384, 0.0),
+        4: (3 * vREF / 16384, -1.5 * vREF),
+        5: (3 * vREF / 16384, -3 * vREF),
+        6: (3 * vREF / 16384, 0.0),
+        7: (6 * vREF / 16384, -3 * vREF),
+    }
+
+_RANGES = _range_table(4.096)
+
+# The listener always reads in range 1; bind its constants once
+_V_SCALE, _V_OFFSET = _RANGES[1]
+# ...and tabulate every 14-bit code, so conversion is a single list index
+ADC_CODES = 1 << 14
+_V_LUT = [code * _V_SCALE + _V_OFFSET for code in range(ADC_CODES)]
 
 # --- CSV Setup ---
 CSV_PATH = None
 csv_file = None
-csv_writer = None
 csv_index = 0
 
+# Rows are buffered and each full batch is handed to a dedicated writer
+# thread over a bounded queue, so file I/O never blocks the serial listener.
+ROW_BATCH = 100          # ~1 s of samples at 100 Hz
+FLUSH_INTERVAL_S = 1.0   # hand off a partial batch after this long
+CSV_BUFFERING = 65536
+
+# Optional compact log: fixed-size little-endian records in experiment_log.bin
+# instead of CSV text (decode with decode_log.py). Missing ellipse values
+# are NaN; frame_name is NUL-padded to 32 bytes.
+BINARY_LOG = False
+_BIN_REC = struct.Struct("<IqIIfffffff32sff??")
+_NAN = float("nan")
+_row_buf = []
+_flush_state = {'last': time.monotonic()}
+CSV_QUEUE_BATCHES = 64   # ~1 min of batches before the oldest is dropped
+_csv_queue = Queue(maxsize=CSV_QUEUE_BATCHES)
+_csv_thread = None
+
+# Every column is numeric or a plain file name, so rows skip the csv
+# dialect machinery and go through one fixed template (csv.writer's \r\n).
+# The file is opened in binary mode; rows are ASCII-encoded once per batch.
+CSV_HEADER = (
+    "index","timestamp_ns","seq","ms","motor_angle_deg", "motor_speed",
+    "CH0_volts","CH2_volts","CH3_volts",
+    "ellipse_angle_deg", "ellipse_area_px2", "frame_name",
+    "ch2_dv/dt", 'ch3_dv/dt', 'ch2_flag', 'ch3_flag'
+)
+_ROW_FMT = ("{},{},{},{},{},{},{:.6f},{:.6f},{:.6f},{},{},{},"
+            "{:.6f},{:.6f},{},{}\r\n").format
+
+def _write_rows(rows):
+    # Rows arrive with raw float volts in columns 6-8 and (ch2_prev, ch3_prev)
+    # in 12-13. Derivatives and flags are computed for the whole batch, and
+    # all formatting happens here, off the listener thread.
+    v = np.array([(r[7], r[8], r[12], r[13]) for r in rows], dtype=np.float64)
+    dv = (v[:, :2] - v[:, 2:]) * _INV_DT
+    flags = np.greater(dv, derivatives['threshold'])
+    dv_rows, flag_rows = dv.tolist(), flags.tolist()
+    if BINARY_LOG:
+        pack = _BIN_REC.pack
+        csv_file.write(b"".join([
+            pack(*r[:9], _NAN if r[9] == "" else r[9], _NAN if r[10] == "" else r[10],
+                 r[11].encode(), d2, d3, f2, f3)
+            for r, (d2, d3), (f2, f3) in zip(rows, dv_rows, flag_rows)
+        ]))
+    else:
+        csv_file.write("".join([
+            _ROW_FMT(*r[:12], d2, d3, f2, f3)
+            for r, (d2, d3), (f2, f3) in zip(rows, dv_rows, flag_rows)
+        ]).encode("ascii"))
+    # Publish the newest row's derivative state
+    (d2, d3), (f2, f3) = dv_rows[-1], flag_rows[-1]
+    derivatives.update(ch2=d2, ch3=d3, ch2_flag=f2, ch3_flag=f3)
+    csv_file.flush()
+
+def _csv_writer_thread():
+    # Single consumer keeps rows in order; None is the shutdown sentinel
+    while True:
+        rows = _csv_queue.get()
+        if rows is None:
+            break
+        try:
+            _write_rows(rows)
+        except Exception as e:
+            # One bad batch must not kill the writer and back up the queue
+            print(f"[!] CSV write error: {e}")
+
+def _flush_rows():
+    global _row_buf
+    _flush_state['last'] = time.monotonic()
+    if _row_buf and csv_file:
+        rows, _row_buf = _row_buf, []
+        try:
+            _csv_queue.put_nowait(rows)
+        except Full:
+            # Disk is stalled; keep the newest rows rather than block ingest
+            try:
+                _csv_queue.get_nowait()
+            except Empty:
+                pass
+            _csv_queue.put_nowait(rows)
+            print("[!] CSV writer behind; dropped oldest batch of rows.")
+
 def init_csv():
-    global CSV_PATH, csv_file, csv_writer, csv_index
-    # make base dir
-    os.makedirs(file_state["CURRENT_DIR"], exist_ok=True)
-    # make images subfolder too
-    images_dir = os.path.join(file_state["CURRENT_DIR"], "images")
-    os.makedirs(images_dir, exist_ok=True)
-
-    CSV_PATH = os.path.join(file_state["CURRENT_DIR"], "experiment_log.csv")
-    csv_file = open(CSV_PATH, "w", newline="")
-    csv_writer = csv.writer(csv_file)
-    csv_writer.writerow([
-        "index","timestamp","seq","ms","motor_angle_deg", "motor_speed",
-        "CH0_volts","CH2_volts","CH3_volts",
-        "ellipse_angle_deg", "ellipse_area_px2", "frame_name",
-        "ch2_dv/dt", 'ch3_dv/dt', 'ch2_flag', 'ch3_flag'
-    ])
+    global CSV_PATH, csv_file, csv_index, _csv_thread
+    # run folder and its images/ subfolder (created once per run)
+    run_dir = init_run_dir()
+
+    name = "experiment_log.bin" if BINARY_LOG else "experiment_log.csv"
+    CSV_PATH = os.path.join(run_dir, name)
+    csv_file = open(CSV_PATH, "wb", buffering=CSV_BUFFERING)
+    if not BINARY_LOG:
+        # The binary log is headerless; its layout is fixed by _BIN_REC
+        csv_file.write((",".join(CSV_HEADER) + "\r\n").encode("ascii"))
 
     csv_index = 0
 
+    _csv_thread = threading.Thread(target=_csv_writer_thread, daemon=True)
+    _csv_thread.start()
+
 def _close_csv():
     global csv_file
     if csv_file:
+        # Let the writer drain what is queued, then write the last partial
+        # batch inline.
+        if _csv_thread and _csv_thread.is_alive():
+            _csv_queue.put(None)
+            _csv_thread.join()
+        if _row_buf:
+            _write_rows(_row_buf)
+        # Make the finished log durable once, rather than syncing per batch
+        csv_file.flush()
+        os.fsync(csv_file.fileno())
         csv_file.close()
 
 atexit.register(_close_csv)
@@ -126,6 +226,7 @@ atexit.register(_close_csv)
 
 # --- Serial Connection Setup ---
 try:
+    # Reads block until data arrives; the timeout is only a watchdog
     ser = serial.Serial(SERIAL_PORT, BAUD, timeout=1)
     time.sleep(2)  # Wait for serial port to initialize
     print(f"[i] Serial connection established on {SERIAL_PORT} @ {BAUD}.")
@@ -134,12 +235,15 @@ except serial.SerialException as e:
     ser = None
 
 # --- Serial Command Functions ---
+# Bare commands (stop, reverse, find origin) are encoded once; only 'S' carries a value
+_CMD_BYTES = {c: f"{c}\n".encode() for c in "XTL"}
+
 def send_command(command, value=None):
     if ser:
         if value is not None:
-            message = f"{command}{value}\n".encode()
+            message = b"%s%d\n" % (command.encode(), value)
         else:
-            message = f"{command}\n".encode()
+            message = _CMD_BYTES.get(command) or f"{command}\n".encode()
         try:
             ser.write(message)
         except serial.SerialException as e:
@@ -148,90 +252,162 @@ def send_command(command, value=None):
         print("Serial port not connected.")
 
 # --- Serial Listener Thread ---
+_serial_tail = {'buf': b''}
+
+# On POSIX, read the tty fd directly: one select + os.read per burst instead
+# of going through pyserial's read loop. pyserial opens it non-blocking, so
+# wait with select first. Other platforms keep the pyserial path.
+try:
+    _ser_fd = ser.fileno() if ser else None
+except (AttributeError, OSError):
+    _ser_fd = None
+SERIAL_READ_CHUNK = 4096
+
+def _read_lines():
+    """
+    Return every complete line now buffered on the port (without b'\\n').
+    Blocks for the first byte only; a partial last line is kept for next time.
+    """
+    if _ser_fd is not None:
+        ready, _, _ = select.select([_ser_fd], [], [], ser.timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(_ser_fd, SERIAL_READ_CHUNK)
+        except BlockingIOError:
+            # Spurious wakeup on the O_NONBLOCK fd (EAGAIN); pyserial ignores it too
+            return []
+        if not data:
+            # Readable but empty means the device went away
+            raise serial.SerialException("device disconnected")
+    else:
+        data = ser.read(ser.in_waiting or 1)
+        if not data:
+            return []
+    lines = (_serial_tail['buf'] + data).split(b"\n")
+    _serial_tail['buf'] = lines.pop()
+    return lines
+
+def _prioritise_listener():
+    """
+    Best-effort scheduling hints for the calling thread (Linux): a small
+    nice boost and, on 3+ cores, pinning to the last core so Tk keeps the
+    others. Silently skipped without permission or on other platforms.
+    """
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), -5)
+    except (AttributeError, OSError):
+        pass
+    try:
+        cpus = sorted(os.sched_getaffinity(0))
+        if len(cpus) >= 3:
+            os.sched_setaffinity(0, {cpus[-1]})
+    except (AttributeError, OSError):
+        pass
+
 def serial_listener_thread():
-    global degrees, latest, csv_index
+    global degrees, csv_index
     if not ser:
         return
     print("[i] Starting serial listener thread.")
+    _prioritise_listener()
+
+    # Bind everything the per-sample path touches to locals (LOAD_FAST).
+    # _row_buf is rebound by _flush_rows, so it stays a global lookup.
+    volts, n_codes = _V_LUT, ADC_CODES
+    vs, snap, ring, mask = v_state, latest, ring_state, RING_MASK
+    a0, a1 = ring_a0, ring_a1
+    motor, ellipse, frame = motor_state, ellipse_state, frame_state
+    wall, mono = time.time_ns, time.monotonic
+    flush_state = _flush_state
+
     while True:
         try:
-            raw = ser.readline()
-            if not raw:
-                continue
-            line = raw.decode('utf-8', errors='ignore').strip()
-            if not line:
-                continue
-
-            # 1) CSV sample line
-            if ',' in line and not line.startswith('[') and not line.lower().startswith('seq'):
-                parts = line.split(',')
-                if len(parts) == 5:
+            lines = _read_lines()
+        except (serial.SerialException, OSError) as e:
+            print(f"[!] Serial error: {e}")
+            break
+
+        for raw in lines:
+            try:
+                if not raw:
+                    continue
+
+                # 1) CSV sample line, parsed straight from the bytes. int()
+                # would also take signs, '_' and inner padding, so only lines
+                # of plain digits and commas are parsed, and the ADC codes
+                # must index the 14-bit LUT (a negative one would wrap).
+                fields = raw.split(b",")
+                if len(fields) == CSV_FIELDS:
+                    if not raw.strip().replace(b",", b"").isdigit():
+                        continue  # header (seq,ms,...) or a garbled line
                     try:
-                        seq, ms, ch0_raw, ch2_raw, ch3_raw = map(int, parts)
+                        seq, ms, ch0_raw, ch2_raw, ch3_raw = map(int, fields)
                     except ValueError:
+                        continue  # empty field
+                    if ch0_raw >= n_codes or ch2_raw >= n_codes or ch3_raw >= n_codes:
                         continue
 
                     # Convert to volts
-                    ch0_v = convert_to_voltage(ch0_raw, inputRange=1)
-                    ch2_v = convert_to_voltage(ch2_raw, inputRange=1)
-                    ch3_v = convert_to_voltage(ch3_raw, inputRange=1)
-
-                    if v_state['record']:
-                    # compute derivatives
-                        for ch, current_v in (("ch2", ch2_v), ("ch3", ch3_v)):
-                            prev_key = f"{ch}_prev"
-                            dv = (current_v - v_state[prev_key]) / 0.01  # 100 Hz → dt = 0.01 s
-                            derivatives[ch] = dv
-                            derivatives[f"{ch}_flag"] = dv > derivatives["threshold"]
-                            # update previous value
-                            v_state[prev_key] = current_v
-                        
+                    ch0_v = volts[ch0_raw]
+                    ch2_v = volts[ch2_raw]
+                    ch3_v = volts[ch3_raw]
+
+                    # Derivatives are computed per batch on the writer thread;
+                    # rows only carry this sample and the one before it
+                    if vs['record']:
+                        ch2_prev, ch3_prev = vs['ch2_prev'], vs['ch3_prev']
                     else:
-                        v_state['record'] = True
-                    
-                    # Update latest snapshot
-                    latest.update({"seq": seq, "ms": ms,
-                                   "ch0": ch0_v, "ch2": ch2_v, "ch3": ch3_v})
-
-                    # Push CH2/CH3 to queues
-                    _q_put_drop_oldest(data_queue_a0, ch2_v)
-                    _q_put_drop_oldest(data_queue_a1, ch3_v)
-
-                    # Motor angle
-                    motor_angle = motor_state.get("angle", 0.0)
-                    angle = ellipse_state.get("angle_deg")
-                    area  = ellipse_state.get("area_px2")
-                    
-                    # Write CSV row if motor running
-                    if motor_state['running']:
-                        ts = time.time()
-                        csv_writer.writerow([
-                            csv_index, ts, seq, ms, motor_angle, motor_state['rpm'],
-                            f"{ch0_v:.6f}", f"{ch2_v:.6f}", f"{ch3_v:.6f}",
+                        ch2_prev, ch3_prev = ch2_v, ch3_v
+                        vs['record'] = True
+                    vs['ch2_prev'], vs['ch3_prev'] = ch2_v, ch3_v
+
+                    # Update latest snapshot in place (no per-sample dict)
+                    snap["seq"] = seq
+                    snap["ms"] = ms
+                    snap["ch0"] = ch0_v
+                    snap["ch2"] = ch2_v
+                    snap["ch3"] = ch3_v
+
+                    # Publish CH2/CH3 to the plot ring
+                    slot = ring['head'] & mask
+                    a0[slot] = ch2_v
+                    a1[slot] = ch3_v
+                    ring['head'] += 1
+
+                    # Buffer CSV row if motor running and a log is open (none
+                    # when run standalone without init_csv); the motor/camera
+                    # state is only read for samples that are actually logged
+                    if motor['running'] and csv_file:
+                        angle = ellipse.get("angle_deg")
+                        area  = ellipse.get("area_px2")
+                        _row_buf.append([
+                            csv_index, wall(), seq, ms, motor.get("angle", 0.0), motor['rpm'],
+                            ch0_v, ch2_v, ch3_v,
                             round(angle, 2) if angle is not None else "",
                             round(area, 1) if area is not None else "",
-                            frame_state['name'], f"{derivatives['ch2']:.6f}", f"{derivatives['ch3']:.6f}",
-                            derivatives['ch2_flag'], derivatives['ch3_flag']
+                            frame['name'], ch2_prev, ch3_prev
                         ])
-
-                        csv_file.flush()
                         csv_index += 1
-                        continue
-
-            # 2) Handle markers
-            if line == "PROBE_LOW":
-                print("[EVENT] Probe activated!")
-            elif line == "RUNNING":
-                motor_state['running'] = True
-            elif line == "STOP":
-                motor_state['running'] = False
 
-        except serial.SerialException as e:
-            print(f"[!] Serial error: {e}")
-            break
-        except Exception as e:
-            print(f"[!] Error reading serial line: {e}")
-        time.sleep(0.005)
+                    # Hand rows to the writer when the batch is full, or when
+                    # a partial batch is getting stale (e.g. motor stopped)
+                    if _row_buf and (len(_row_buf) >= ROW_BATCH or
+                                     mono() - flush_state['last'] >= FLUSH_INTERVAL_S):
+                        _flush_rows()
+                    continue
+
+                # 2) Handle markers
+                line = raw.strip()
+                if line == b"PROBE_LOW":
+                    print("[EVENT] Probe activated!")
+                elif line == b"RUNNING":
+                    motor['running'] = True
+                elif line == b"STOP":
+                    motor['running'] = False
+
+            except Exception as e:
+                print(f"[!] Error reading serial line: {e}")
 
 if ser:
     listener_thread = threading.Thread(target=serial_listener_thread, daemon=True)
@@ -350,34 +526,48 @@ def handle_enter(event=None):
     send_command('S', int(sps_value))
     update_gui_state()
 
+RAMP_STEPS = [1, 6, 11, 16, 21, 26, 26, 21, 16, 11, 6, 1]
+RAMP_HOLD_S = 1500
+
 def auto_ramp_sequence():
     """Automatically ramps RPM up and down in 5-RPM steps with 1-minute holds."""
     if not ser:
         print("[!] No serial connection available.")
         return
 
-    ramp_steps = [1, 6, 11, 16, 21, 26, 26, 21, 16, 11, 6, 1]
     motor_state['running'] = True
     print("[AUTO] Starting auto ramp sequence...")
+    _ramp_step(0, 0)
 
-    for rpm in ramp_steps:
+def _ramp_step(i, held):
+    """
+    One tick of the ramp: step i of RAMP_STEPS, 'held' seconds into its hold.
+    Runs on the main GUI loop via root.after, like update_timer_display.
+    """
+    if not motor_state['running']:
+        print("[AUTO] Sequence interrupted.")
+        send_command('X')
+        return
+
+    if held == 0:
+        if i == len(RAMP_STEPS):
+            print("[AUTO] Sequence complete. Stopping motor.")
+            send_command('X')
+            motor_state['running'] = False
+            return
+
+        rpm = RAMP_STEPS[i]
         motor_state['rpm'] = rpm
         update_tkinter_input_box(freq, rpm)
         sps_value = (rpm / 60.0) * motor_state['spr']
         send_command('S', int(sps_value))
         update_gui_state()
-        bracket = 1500
-        print(f"[AUTO] Holding {rpm} RPM for {bracket} seconds...")
-        for _ in range(bracket):
-            if not motor_state['running']:
-                print("[AUTO] Sequence interrupted.")
-                send_command('X')
-                return
-            time.sleep(1)
-
-    print("[AUTO] Sequence complete. Stopping motor.")
-    send_command('X')
-    motor_state['running'] = False
+        print(f"[AUTO] Holding {rpm} RPM for {RAMP_HOLD_S} seconds...")
+
+    if held < RAMP_HOLD_S:
+        root.after(1000, _ramp_step, i, held + 1)
+    else:
+        root.after(0, _ramp_step, i + 1, 0)
 
 
 # --- GUI Creation ---
@@ -411,7 +601,7 @@ timer_label = tk.Label(root, text="Timer: Idle", font=("Helvetica", 12, "bold"))
 # ---------------------
 
 input_button = tk.Button(root, text="Apply Speed", command=handle_enter)
-auto_ramp_button = tk.Button(root, text="Auto RPM Ramp", command=lambda: threading.Thread(target=auto_ramp_sequence, daemon=True).start())
+auto_ramp_button = tk.Button(root, text="Auto RPM Ramp", command=auto_ramp_sequence)
 
 
 # Set initial values for entry widgets
@@ -1,5 +1,4 @@
-import time, os
-from states import file_state
+from states import init_run_dir
 
 # Motor GUI (creates Tk root and owns serial)
 from gui.motor_controls_gui import root as motor_root, run_gui
@@ -11,10 +10,7 @@ from gui.camera_feed_gui import attach_camera_feed
 # Option B: camera + plots in one window
 from gui import motor_controls_gui
 
-today = time.strftime("%Y-%m-%d_%H_%M", time.localtime())
-save_dir = f"{file_state['BASE_DIR']}/{today}"
-os.makedirs(save_dir, exist_ok=True)
-file_state['CURRENT_DIR'] = save_dir
+init_run_dir()
 
 # now init CSV in motor_controls_gui
 
@@ -1,6 +1,5 @@
 from machine import SPI, Pin, Timer, ADC
-import time, struct, bluetooth
-import _thread
+import time, struct, bluetooth, micropython
 
 print("=== Feather V2 ADC + BLE Debug ===")
 
@@ -19,9 +18,10 @@ esptool.py --chip esp32 --port /dev/ttyUSB0 --baud 115200 write_flash -z 0x1000
 DEBUG = False        # True = print voltages to USB, False = BLE stream
 vREF = 4.096
 inputRange = 4    # Keep your conditional ranges intact
+SPI_BAUD = 1000000   # was 100 kHz; ADC SCLK is rated well above this
 
 # SPI Setup
-spi = SPI(1, baudrate=100000, polarity=0, phase=0,
+spi = SPI(1, baudrate=SPI_BAUD, polarity=0, phase=0,
           sck=Pin(5), mosi=Pin(18), miso=Pin(19))
 cs = Pin(25, Pin.OUT)
 cs.value(1)
@@ -29,48 +29,61 @@ cs.value(1)
 # ======================================================
 # === ADC FUNCTIONS ===
 # ======================================================
-def configADC(readAddress, rangeV):
-    cmd = bytearray([0b10000000 | (readAddress << 4) | rangeV])
+def configADCs(readAddresses, rangeV):
+    # Back-to-back config bytes in one CS frame, one settling wait for all
+    cmd = bytearray([0b10000000 | (a << 4) | rangeV for a in readAddresses])
     cs.value(0)
     spi.write(cmd)
     cs.value(1)
     time.sleep_us(50)
 
+# One transfer buffer reused by every read; the timer callback never
+# re-enters, so the reads can't overlap
+_rd = bytearray(4)
+
+@micropython.native
 def readADC(readAddress):
-    cmd = bytearray(4)
+    cmd = _rd
     cmd[0] = 0b10000000 | (readAddress << 4)
+    cmd[1] = cmd[2] = cmd[3] = 0
     cs.value(0)
     spi.write_readinto(cmd, cmd)
     cs.value(1)
-    raw = ((cmd[2] << 8) | cmd[3]) >> 2
-    return raw
-
+    # 14-bit code sits left-aligned in bytes 2..3 of the SPI response
+    return ((cmd[2] << 8) | cmd[3]) >> 2
+
+# Input range -> (volts per code, offset). Each firmware script is flashed
+# on its own, so server_debug.py and the host's _range_table carry the same
+# table; keep them in step. An unknown range reads as plain 0..vREF.
+_RANGES = {
+    1: (1.5 * vREF / 16384, -0.75 * vREF),
+    2: (1.5 * vREF / 16384, -1.5 * vREF),
+    3: (1.5 * vREF / 16384, 0.0),
+    4: (3 * vREF / 16384, -1.5 * vREF),
+    5: (3 * vREF / 16384, -3 * vREF),
+    6: (3 * vREF / 16384, 0.0),
+    7: (6 * vREF / 16384, -3 * vREF),
+}
+_SCALE, _OFFSET = _RANGES.get(inputRange, (vREF / 16384, 0.0))
+
+@micropython.native
 def convert_to_voltage(raw):
-    ratio = raw / (1 << 14)
-    if inputRange == 1:
-        return ratio * 3 * vREF / 2 - 1.5 * vREF / 2
-    elif inputRange == 2:
-        return ratio * 3 * vREF / 2 - 3 * vREF / 2
-    elif inputRange == 3:
-        return ratio * 3 * vREF / 2
-    elif inputRange == 4:
-        return ratio * 3 * vREF - 1.5 * vREF
-    elif inputRange == 5:
-        return ratio * 3 * vREF - 3 * vREF
-    elif inputRange == 6:
-        return ratio * 3 * vREF
-    elif inputRange == 7:
-        return ratio * 6 * vREF - 3 * vREF
-    return 0
+    return raw * _SCALE + _OFFSET
+
+# The ADC latches the input range per channel, so configure once at boot
+# instead of paying three CS frames + settling delays on every timer tick.
+configADCs((0, 2, 3), inputRange)
 
 # ======================================================
 # === INLINE BLE ADVERTISING PAYLOAD ===
 # ======================================================
 import struct as _struct
 def advertising_payload(limited_disc=False, br_edr=False, name=None, services=None):
-    payload = bytearray()
+    # Built once at boot; each AD field is [len][type][value]
+    parts = []
     def _append(adv_type, value):
-        payload.extend(_struct.pack("BB", len(value) + 1, adv_type) + value)
+        parts.append(_struct.pack("BB", len(value) + 1, adv_type))
+        parts.append(value)
     _append(0x01, _struct.pack("B", (0x02 if limited_disc else 0x06) +
                                       (0x00 if br_edr else 0x04)))
     if name:
@@ -82,17 +95,23 @@ def advertising_payload(limited_disc=False, br_edr=False, name=None, services=No
                 _append(0x03, b)
             elif len(b) == 16:
                 _append(0x07, b)
-    return payload
+    return b"".join(parts)
 
 # ======================================================
 # === BLE SETUP ===
 # ======================================================
 _IRQ_CENTRAL_CONNECT = const(1)
 _IRQ_CENTRAL_DISCONNECT = const(2)
+_IRQ_MTU_EXCHANGED = const(21)
+
+# Match the client's setMTU(128) so notifies aren't capped at the default
+# 20-byte ATT payload once packets carry more than one sample.
+BLE_MTU = 128
 
 ble = bluetooth.BLE()
 ble.active(True)
-print("[INIT] BLE active")
+ble.config(mtu=BLE_MTU)
+print("[INIT] BLE active, MTU =", ble.config("mtu"))
 
 SVC_UUID = bluetooth.UUID("4fafc201-1fb5-459e-8fcc-c5c9c331914b")
 CHR_UUID = bluetooth.UUID("beb5483e-36e1-4688-b7f5-ea07361b26a8")
@@ -107,6 +126,7 @@ print("[INIT] Raw handles returned:", handles)
 
 # Your build shows ((16,),) so grab [0][0]
 adc_handle = handles[0][0]
+ble.gatts_set_buffer(adc_handle, BLE_MTU - 3)   # max notify payload
 print("[INIT] Using adc_handle =", adc_handle)
 
 def irq(event, data):
@@ -116,6 +136,9 @@ def irq(event, data):
     elif event == _IRQ_CENTRAL_DISCONNECT:
         print("[BLE] Central disconnected — restarting advertising")
         advertise()
+    elif event == _IRQ_MTU_EXCHANGED:
+        conn_handle, mtu = data
+        print("[BLE] MTU exchanged:", mtu)
 
 ble.irq(irq)
 adv_payload = advertising_payload(services=[SVC_UUID])
@@ -147,65 +170,84 @@ def read_vbat():
 # ======================================================
 seq = 0
 t0 = time.ticks_ms()
-
+notify_fails = 0
+NOTIFY_FAIL_LOG_EVERY = 10    # ~1 s of failures at ~12 batches/s
+
+# Samples are packed back to back and notified once per batch instead of
+# once per tick; each record is [seq][ms][ch0][ch2][ch3] (14 bytes).
+PKT_FMT = "<IIHHH"
+PKT_SIZE = struct.calcsize(PKT_FMT)
+BATCH_N = (BLE_MTU - 3) // PKT_SIZE   # 8 samples per 125-byte payload
+batch = bytearray(BATCH_N * PKT_SIZE)
+batch_idx = 0
+
+# Native-compiled to skip bytecode dispatch on the 100 Hz path; the
+# BLE and SPI calls still go through the normal Python call path.
+@micropython.native
 def send_packet(timer):
-    global seq
-    now = time.ticks_ms()
-    ms = time.ticks_diff(now, t0)
+    global seq, notify_fails, batch_idx
 
-    # Configure and read channels
-    configADC(0, inputRange)
-    configADC(2, inputRange)
-    configADC(3, inputRange)
+    # Read channels (ranges were latched at boot)
     ch0 = readADC(0)
     ch2 = readADC(2)
     ch3 = readADC(3)
 
-    pkt = struct.pack("<IIHHH", seq, ms, ch0, ch2, ch3)
-    ble.gatts_notify(0, adc_handle, pkt)
+    # Stamp once the conversions are done, so the time matches the data
+    # rather than the start of the SPI burst
+    ms = time.ticks_diff(time.ticks_ms(), t0)
 
-    if DEBUG:
-        v2 = convert_to_voltage(ch2)
-        v3 = convert_to_voltage(ch3)
-        print("[ADC] CH2 raw={} V={:.5f}".format(ch2, v2))
-        print("[ADC] CH3 raw={} V={:.5f}".format(ch3, v3))
-    else:
-        pkt = struct.pack("<IIHH", seq, ms, ch2, ch3)  # [seq][ms][ch2][ch3]
+    struct.pack_into(PKT_FMT, batch, batch_idx * PKT_SIZE, seq, ms, ch0, ch2, ch3)
+    batch_idx += 1
+    if batch_idx == BATCH_N:
+        batch_idx = 0
         try:
-            ble.gatts_notify(0, adc_handle, pkt)
-            # print("[BLE] Notify seq={} ms={} ch2={} ch3={}".format(seq, ms, ch2, ch3))
+            ble.gatts_notify(0, adc_handle, batch)
         except OSError as e:
-            # -128 = not ready / unsubscribed yet
-            print("[BLE] Notify failed (seq={}, err={})".format(seq, e))
+            # -128 = not ready / unsubscribed yet. This fires every batch
+            # until a central subscribes, so only log every Nth failure.
+            if notify_fails % NOTIFY_FAIL_LOG_EVERY == 0:
+                print("[BLE] Notify failed (seq={}, err={}, total={})".format(seq, e, notify_fails + 1))
+            notify_fails += 1
 
+    seq += 1
 
+def print_sample(timer):
+    # DEBUG mode only: read and print over USB, nothing goes out over BLE
+    global seq
+    ch2 = readADC(2)
+    ch3 = readADC(3)
+    v2 = convert_to_voltage(ch2)
+    v3 = convert_to_voltage(ch3)
+    print("[ADC] CH2 raw={} V={:.5f}".format(ch2, v2))
+    print("[ADC] CH3 raw={} V={:.5f}".format(ch3, v3))
     seq += 1
 
 
 led = Pin(13, Pin.OUT)   # adjust if needed, sometimes Pin(2) is the LED
 
-def led_thread():
-    while True:
-        vbat = read_vbat()
-        if vbat > 3.5:
-            led.value(1)   # LED on
-            time.sleep(0.5)
-            led.value(0)   # LED off
-        # wait remaining time of 5s period
-        time.sleep(4.5)
-
-# start the LED blink thread
+# Battery LED: a 0.5 s on-pulse every 5 s while vbat > 3.5 V. Driven by a
+# 2 Hz hardware timer stepping a 10-tick cycle instead of a sleeping thread.
+LED_TICKS = 10
+led_tick = 0
 
+def led_cb(timer):
+    global led_tick
+    if led_tick == 0:
+        led.value(1 if read_vbat() > 3.5 else 0)
+    elif led_tick == 1:
+        led.value(0)
+    led_tick = (led_tick + 1) % LED_TICKS
 
 
 if DEBUG:
     print("[MODE] Debug print mode")
     while True:
-        send_packet(None)
+        print_sample(None)
         time.sleep(3)
 else:
     print("[MODE] BLE streaming at 100 Hz")
     tim = Timer(0)
-    print("Starting LED monitoring thread...")
-    _thread.start_new_thread(led_thread, ())
+    print("Starting LED monitoring timer...")
+    led_tim = Timer(1)
+    led_tim.init(freq=2, mode=Timer.PERIODIC, callback=led_cb)
     tim.init(freq=100, mode=Timer.PERIODIC, callback=send_packet)
@@ -1,5 +1,5 @@
 from machine import SPI, Pin, Timer
-import time
+import time, micropython
 
 print("--- Starting 1Hz ADC Test (Standard Feather) ---")
 
@@ -8,10 +8,11 @@ print("--- Starting 1Hz ADC Test (Standard Feather) ---")
 # ======================================================
 vREF = 4.096
 inputRange = 4 
+SPI_BAUD = 1000000   # was 100 kHz; ADC SCLK is rated well above this
 
 # Pins for Standard Feather (Huzzah32):
 # SCK=5, MOSI=18, MISO=19. Hardware ID is 2 (VSPI).
-spi = SPI(2, baudrate=100000, polarity=0, phase=0,
+spi = SPI(2, baudrate=SPI_BAUD, polarity=0, phase=0,
           sck=Pin(5), mosi=Pin(18), miso=Pin(19))
 
 # Chip Select - verify wire is on pin 25
@@ -29,10 +30,13 @@ def configADC(readAddress, rangeV):
     cs.value(1)
     time.sleep_us(50)
 
+_rd = bytearray(4)
+
 def readADC(readAddress):
-    # Your V2 code used a 4-byte buffer for the read
-    cmd = bytearray(4)
+    # Your V2 code used a 4-byte buffer for the read; reuse one
+    cmd = _rd
     cmd[0] = 0b10000000 | (readAddress << 4)
+    cmd[1] = cmd[2] = cmd[3] = 0
     cs.value(0)
     spi.write_readinto(cmd, cmd)
     cs.value(1)
@@ -40,22 +44,35 @@ def readADC(readAddress):
     raw = ((cmd[2] << 8) | cmd[3]) >> 2
     return raw
 
+# (scale, offset) per input range, so volts = raw * scale + offset.
+# inputRange is fixed at deploy time, so resolve it once at import.
+_RANGES = {
+    1: (1.5 * vREF / 16384, -0.75 * vREF),
+    2: (1.5 * vREF / 16384, -1.5 * vREF),
+    3: (1.5 * vREF / 16384, 0.0),
+    4: (3 * vREF / 16384, -1.5 * vREF),
+    5: (3 * vREF / 16384, -3 * vREF),
+    6: (3 * vREF / 16384, 0.0),
+    7: (6 * vREF / 16384, -3 * vREF),
+}
+_SCALE, _OFFSET = _RANGES.get(inputRange, (vREF / 16384, 0.0))
+
+@micropython.native
 def convert_to_voltage(raw):
-    ratio = raw / 16384.0  # 2^14
-    if inputRange == 4:
-        return (ratio * 3 * vREF) - (1.5 * vREF)
-    return ratio * vREF
+    return raw * _SCALE + _OFFSET
 
 # ======================================================
 # === EXECUTION LOOP ===
 # ======================================================
 seq = 0
 
+# Target Channel 2 (as in your previous tests); the range latches, so
+# configure it once rather than before every read
+configADC(2, inputRange)
+
 def run_sample(timer):
     global seq
     
-    # Target Channel 2 (as in your previous tests)
-    configADC(2, inputRange)
     raw_val = readADC(2)
     voltage = convert_to_voltage(raw_val)
     
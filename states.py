@@ -1,4 +1,6 @@
 # state.py
+import os, time
+from functools import lru_cache
 from threading import Lock
 # Corrected motor_state definition
 spr = 25600  # steps per revolution
@@ -20,6 +22,15 @@ file_state = {
     "index": -1
 }
 
+@lru_cache(maxsize=1)
+def init_run_dir():
+    """Create this run's timestamped folder (with images/) once and return it."""
+    today = time.strftime("%Y-%m-%d_%H_%M", time.localtime())
+    save_dir = f"{file_state['BASE_DIR']}/{today}"
+    os.makedirs(os.path.join(save_dir, "images"), exist_ok=True)
+    file_state['CURRENT_DIR'] = save_dir
+    return save_dir
+
 ellipse_state = {
     "angle_deg": None,
     "area_px2": None